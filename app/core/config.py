@@ -1,4 +1,5 @@
 import os
+import shutil
 from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
@@ -15,7 +16,33 @@ class Settings(BaseSettings):
         "DATABASE_URL",
         f"postgresql://{POSTGRES_USER}:{POSTGRES_PASSWORD}@{POSTGRES_SERVER}/{POSTGRES_DB}"
     )
-    STOCKFISH_PATH: str = "/opt/homebrew/bin/stockfish"  # 更新为正确的路径
+    # 连接池配置
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_RECYCLE: int = 1800  # 秒，定期回收连接以避免服务端超时断开
+    DB_POOL_TIMEOUT: int = 30  # 秒，等待可用连接的超时时间
+    DB_STATEMENT_CACHE_SIZE: int = 100  # asyncpg 预编译语句缓存大小
+    DB_QUERY_CACHE_SIZE: int = 500  # SQLAlchemy 编译后 SQL 的缓存大小
+    STOCKFISH_PATH: str = shutil.which("stockfish") or "/opt/homebrew/bin/stockfish"  # 优先使用 PATH 中的 stockfish
+    STOCKFISH_MAX_ENGINES: int = os.cpu_count() or 1  # 同时运行的引擎进程数上限
+    STOCKFISH_THREADS: int = os.cpu_count() or 1  # 所有搜索共享的线程预算
+    STOCKFISH_HASH_TOTAL_MB: int = 1024  # 所有引擎进程 Hash 总和上限（MB）
+
+    # 批量接口单次请求的最大局面数
+    BATCH_MAX_POSITIONS: int = 500
+    # 批量最佳走法接口每个局面允许的最长搜索时间（秒）
+    BATCH_MAX_TIME_LIMIT: float = 1.0
+    # 导出棋局时每批从数据库读取的行数
+    EXPORT_BATCH_SIZE: int = 500
+
+    # 局面分析结果缓存条目数
+    EVAL_CACHE_SIZE: int = 10000
+
+    # 启动后台预热：加载开局索引、预启动引擎并用常见局面填充分析缓存
+    WARMUP_ENABLED: bool = True
+    WARMUP_ENGINES: int = 1  # 预启动的引擎进程数
+    WARMUP_EVAL_POSITIONS: int = 20  # 预先分析的常见开局局面数
+    WARMUP_EVAL_DEPTH: int = 20  # 与 /analyze 默认深度一致，使预热结果可以命中
     
     class Config:
         env_file = ".env"
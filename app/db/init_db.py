@@ -1,15 +1,104 @@
 import logging
-from sqlalchemy.orm import Session
+from collections import defaultdict
+from sqlalchemy import inspect, select, text
+from sqlalchemy.orm import aliased
 from app.db.base_class import Base
 from app.db.session import engine
 from app.models.player import Player
 from app.models.game import Game
+from app.services.game_service import GameService
+
+# 回填内容哈希时每批处理的行数
+BACKFILL_BATCH_SIZE = 1000
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def init_db(db: Session) -> None:
+def _add_missing_columns(conn) -> None:
+    """为已存在的表补充模型中新增的列（create_all 不会修改已有表），可重复执行"""
+    inspector = inspect(conn)
+    existing_tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}"
+            if column.server_default is not None and isinstance(column.server_default.arg, str):
+                ddl += f" DEFAULT '{column.server_default.arg}'"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            logger.info(f"添加列 {table.name}.{column.name}")
+            conn.execute(text(ddl))
+
+def _create_missing_indexes(conn) -> None:
+    """为已存在的表补充模型中新增的索引（如 games.content_hash 的唯一索引），可重复执行"""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+def _backfill_content_hashes(conn) -> None:
+    """为升级前保存的棋局计算内容哈希，可重复执行
+
+    重复的棋局只有 id 最小的一条写入哈希，其余保持 NULL 并在日志中列出，不会违反唯一索引。
+    """
+    game_service = GameService()
+    white, black = aliased(Player), aliased(Player)
+    query = (
+        select(Game.id, Game.pgn, Game.fen, white.name, black.name)
+        .outerjoin(white, Game.white_player_id == white.id)
+        .outerjoin(black, Game.black_player_id == black.id)
+        .filter(Game.content_hash.is_(None))
+        .order_by(Game.id)
+    )
+    result = conn.execution_options(stream_results=True).execute(query)
+
+    filled = 0
+    invalid = []
+    duplicates = defaultdict(list)
+    for rows in result.partitions(BACKFILL_BATCH_SIZE):
+        batch = {}
+        for game_id, pgn, fen, white_name, black_name in rows:
+            try:
+                content_hash = game_service.compute_content_hash(pgn or "", fen, white_name, black_name)
+            except ValueError:
+                invalid.append(game_id)
+                continue
+            if content_hash in batch:
+                duplicates[content_hash].append(game_id)
+            else:
+                batch[content_hash] = game_id
+
+        # 与已有哈希（含之前批次写入的）重复的棋局不写入
+        existing = dict(conn.execute(
+            select(Game.content_hash, Game.id).filter(Game.content_hash.in_(list(batch)))
+        ).all()) if batch else {}
+        updates = []
+        for content_hash, game_id in batch.items():
+            if content_hash in existing:
+                duplicates[content_hash].append(game_id)
+            else:
+                updates.append({"hash": content_hash, "id": game_id})
+        if updates:
+            conn.execute(text("UPDATE games SET content_hash = :hash WHERE id = :id"), updates)
+            filled += len(updates)
+
+    if filled:
+        logger.info(f"已为 {filled} 盘棋局回填内容哈希")
+    if invalid:
+        logger.warning(f"{len(invalid)} 盘棋局的 PGN 无法完整解析，未回填哈希: {invalid}")
+    for content_hash, game_ids in duplicates.items():
+        kept = conn.execute(select(Game.id).filter(Game.content_hash == content_hash)).scalar()
+        logger.warning(f"重复棋局: 保留 {kept}，重复 {game_ids}（哈希 {content_hash[:12]}）")
+
+async def init_db() -> None:
     # 创建表
     logger.info("创建数据库表")
-    Base.metadata.create_all(bind=engine)
-    logger.info("数据库表创建完成")
\ No newline at end of file
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_add_missing_columns)
+        await conn.run_sync(_backfill_content_hashes)
+        await conn.run_sync(_create_missing_indexes)
+    logger.info("数据库表创建完成")
@@ -1,21 +1,49 @@
-from sqlalchemy import create_engine
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from app.core.config import settings
 
-# 创建数据库引擎
-engine = create_engine(
-    settings.DATABASE_URL,
-    pool_pre_ping=True,  # 自动检测连接是否有效
-)
+# 同步驱动到异步驱动的映射
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
 
-# 创建会话工厂
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def _build_async_url(database_url: str):
+    """将配置中的数据库连接字符串转换为异步驱动"""
+    url = make_url(database_url)
+    url = url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+    if url.drivername == "postgresql+asyncpg":
+        # asyncpg 预编译语句缓存大小
+        url = url.update_query_dict({
+            "prepared_statement_cache_size": str(settings.DB_STATEMENT_CACHE_SIZE)
+        })
+    return url
+
+def _engine_options(url) -> dict:
+    """连接池配置（SQLite 使用驱动默认连接池）"""
+    options = {
+        "pool_pre_ping": True,  # 自动检测连接是否有效
+        "query_cache_size": settings.DB_QUERY_CACHE_SIZE,
+    }
+    if not url.drivername.startswith("sqlite"):
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+        )
+    return options
+
+# 创建异步数据库引擎
+database_url = _build_async_url(settings.DATABASE_URL)
+engine = create_async_engine(database_url, **_engine_options(database_url))
+
+# 创建会话工厂（提交后不过期，避免在异步上下文中触发延迟加载）
+AsyncSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 
 # 获取数据库会话
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
@@ -1,34 +1,108 @@
 from fastapi import FastAPI, Depends, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import Optional, List
-from sqlalchemy.orm import Session
+from contextlib import asynccontextmanager
+from datetime import datetime
+import asyncio
+import json
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.config import settings
-from app.db.session import get_db
+from app.db.session import AsyncSessionLocal, engine, get_db
 from app.services.stockfish_service import StockfishService
 from app.services.opening_service import OpeningService
 from app.services.game_service import GameService
+from app.services.registry import registry, FAILED, READY, STARTING
+from app.services.warmup import mark_warming, warm_up
 from app.db.init_db import init_db
 
 class AnalysisRequest(BaseModel):
     fen: str
     depth: int = 20
 
+class BatchPositionsRequest(BaseModel):
+    fens: List[str]
+    time_limit: float = 0.1
+
+def _check_batch_size(fens: List[str]):
+    if len(fens) > settings.BATCH_MAX_POSITIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many positions: {len(fens)} > {settings.BATCH_MAX_POSITIONS}"
+        )
+
+def _check_time_limit(time_limit: float):
+    if not 0 < time_limit <= settings.BATCH_MAX_TIME_LIMIT:
+        raise HTTPException(
+            status_code=400,
+            detail=f"time_limit must be in (0, {settings.BATCH_MAX_TIME_LIMIT}]"
+        )
+
+# 应用生命周期：初始化数据库，启动后台预热，关闭时释放引擎和连接池
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    registry.set_state("database", STARTING)
+    try:
+        await init_db()
+        registry.set_state("database", READY)
+    except Exception as e:
+        registry.set_state("database", FAILED, str(e))
+
+    warmup_task = None
+    if settings.WARMUP_ENABLED:
+        mark_warming(registry)
+        warmup_task = asyncio.create_task(warm_up(registry))
+
+    yield
+
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+        await asyncio.gather(warmup_task, return_exceptions=True)
+    stockfish_service = registry.peek("stockfish")
+    if stockfish_service is not None:
+        await asyncio.to_thread(stockfish_service.shutdown)
+    await engine.dispose()
+
 # 创建一个带有/api前缀的路由器
 app = FastAPI(
     title=settings.PROJECT_NAME,
     version=settings.VERSION,
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
-# 创建服务实例
-stockfish_service = StockfishService()
-opening_service = OpeningService()
+# 服务实例在首次使用（或后台预热）时才创建
+def _get_service(name: str):
+    try:
+        return registry.get(name)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Service {name} unavailable: {str(e)}")
+
+def get_stockfish_service() -> StockfishService:
+    return _get_service("stockfish")
+
+def get_opening_service() -> OpeningService:
+    return _get_service("openings")
 
 @app.get("/")
 def read_root():
     return {"message": "Chess Analysis API"}
 
+@app.get("/healthz")
+def healthz():
+    # 存活检查：进程可以响应即可
+    return {"status": "ok", "subsystems": registry.get_status()}
+
+@app.get("/readyz")
+def readyz():
+    # 就绪检查：预热完成且没有子系统失败时才接收流量
+    ready = registry.is_ready()
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "subsystems": registry.get_status()}
+    )
+
 @app.get("/analyze")
 def analyze_position_get():
     return {
@@ -39,7 +113,7 @@ def analyze_position_get():
     }
 
 @app.post("/analyze")
-def analyze_position(request: AnalysisRequest, db: Session = Depends(get_db)):
+def analyze_position(request: AnalysisRequest, stockfish_service: StockfishService = Depends(get_stockfish_service)):
     try:
         result = stockfish_service.analyze_position(request.fen, request.depth)
         return result
@@ -47,16 +121,27 @@ def analyze_position(request: AnalysisRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/best-move")
-def get_best_move(request: AnalysisRequest):
+def get_best_move(request: AnalysisRequest, stockfish_service: StockfishService = Depends(get_stockfish_service)):
     try:
         result = stockfish_service.get_best_move(request.fen)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/best-moves")
+def get_best_moves(request: BatchPositionsRequest, stockfish_service: StockfishService = Depends(get_stockfish_service)):
+    _check_batch_size(request.fens)
+    _check_time_limit(request.time_limit)
+    # 以 NDJSON 按输入顺序流式返回，每行一个结果，单个局面出错不影响其他局面
+    lines = (
+        json.dumps(result, ensure_ascii=False) + "\n"
+        for result in stockfish_service.get_best_moves(request.fens, request.time_limit)
+    )
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
 # 修改开局识别路由，添加/api前缀
 @app.post("/api/identify-opening")
-def identify_opening(request: AnalysisRequest):
+def identify_opening(request: AnalysisRequest, opening_service: OpeningService = Depends(get_opening_service)):
     try:
         result = opening_service.identify_opening(request.fen)
         return result
@@ -65,20 +150,31 @@ def identify_opening(request: AnalysisRequest):
 
 # 保留原来的路由以保持兼容性
 @app.post("/identify-opening")
-def identify_opening_legacy(request: AnalysisRequest):
+def identify_opening_legacy(request: AnalysisRequest, opening_service: OpeningService = Depends(get_opening_service)):
     try:
         result = opening_service.identify_opening(request.fen)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/identify-openings")
+def identify_openings(request: BatchPositionsRequest, opening_service: OpeningService = Depends(get_opening_service)):
+    _check_batch_size(request.fens)
+    try:
+        return {
+            "status": "success",
+            "results": opening_service.identify_openings(request.fens)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 class MoveEvaluationRequest(BaseModel):
     fen: str
     move: str
     depth: int = 20
 
 @app.post("/api/evaluate-move")
-def evaluate_move(request: MoveEvaluationRequest):
+def evaluate_move(request: MoveEvaluationRequest, stockfish_service: StockfishService = Depends(get_stockfish_service)):
     try:
         result = stockfish_service.evaluate_move(
             request.fen,
@@ -103,11 +199,14 @@ class SaveGameRequest(BaseModel):
 class PlayerSuggestionRequest(BaseModel):
     prefix: str
 
+class ImportGamesRequest(BaseModel):
+    pgn: str
+
 # API路由
 @app.post("/api/save-game")
-def save_game(request: SaveGameRequest, db: Session = Depends(get_db)):
+async def save_game(request: SaveGameRequest, db: AsyncSession = Depends(get_db)):
     try:
-        game = game_service.save_game(
+        game = await game_service.save_game(
             db=db,
             fen=request.fen,
             pgn=request.pgn,
@@ -121,13 +220,27 @@ def save_game(request: SaveGameRequest, db: Session = Depends(get_db)):
             "game_id": game.id,
             "name": game.name
         }
+    except ValueError as e:
+        # PGN 中含有非法走法
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/games/import")
+async def import_games(request: ImportGamesRequest, db: AsyncSession = Depends(get_db)):
+    try:
+        result = await game_service.import_games(db, request.pgn)
+        return {
+            "status": "success",
+            **result
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/player-suggestions")
-def get_player_suggestions(request: PlayerSuggestionRequest, db: Session = Depends(get_db)):
+async def get_player_suggestions(request: PlayerSuggestionRequest, db: AsyncSession = Depends(get_db)):
     try:
-        suggestions = game_service.get_player_suggestions(db, request.prefix)
+        suggestions = await game_service.get_player_suggestions(db, request.prefix)
         return {
             "status": "success",
             "suggestions": suggestions
@@ -136,9 +249,9 @@ def get_player_suggestions(request: PlayerSuggestionRequest, db: Session = Depen
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/api/games")
-def get_games(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+async def get_games(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_db)):
     try:
-        games = game_service.get_games(db, skip, limit)
+        games = await game_service.get_games(db, skip, limit)
         return {
             "status": "success",
             "games": [
@@ -155,10 +268,34 @@ def get_games(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/games/export")
+async def export_games(
+    format: str = "pgn",
+    player: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+):
+    if format not in ("pgn", "ndjson"):
+        raise HTTPException(status_code=400, detail="Unsupported format, use 'pgn' or 'ndjson'")
+
+    # 响应流式发送时依赖注入的会话已关闭，因此在生成器内部单独打开会话
+    async def stream_games():
+        async with AsyncSessionLocal() as db:
+            async for chunk in game_service.export_games(db, format, player, date_from, date_to):
+                yield chunk
+
+    media_type = "application/x-chess-pgn" if format == "pgn" else "application/x-ndjson"
+    extension = "pgn" if format == "pgn" else "ndjson"
+    return StreamingResponse(
+        stream_games(),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="games.{extension}"'}
+    )
+
 @app.get("/api/games/{game_id}")
-def get_game(game_id: int, db: Session = Depends(get_db)):
+async def get_game(game_id: int, db: AsyncSession = Depends(get_db)):
     try:
-        game = game_service.get_game(db, game_id)
+        game = await game_service.get_game(db, game_id)
         if not game:
             raise HTTPException(status_code=404, detail="Game not found")
             
@@ -180,18 +317,59 @@ def get_game(game_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-# 在应用启动时初始化数据库
-@app.on_event("startup")
-async def startup_event():
-    db = next(get_db())
+class GameAnalysisItem(BaseModel):
+    game_id: int
+    evals: List[Optional[float]]
+
+class GameAnalysisRequest(BaseModel):
+    games: List[GameAnalysisItem]
+
+@app.post("/api/games/analysis")
+async def record_game_analyses(request: GameAnalysisRequest, db: AsyncSession = Depends(get_db)):
     try:
-        init_db(db)
-    finally:
-        db.close()
+        games = await game_service.record_analyses(
+            db,
+            {item.game_id: item.evals for item in request.games}
+        )
+        return {
+            "status": "success",
+            "games": [
+                {
+                    "id": game.id,
+                    "white_accuracy": game.white_accuracy,
+                    "black_accuracy": game.black_accuracy,
+                    "white_acpl": game.white_acpl,
+                    "black_acpl": game.black_acpl,
+                    "white_blunders": game.white_blunders,
+                    "black_blunders": game.black_blunders,
+                    "white_mistakes": game.white_mistakes,
+                    "black_mistakes": game.black_mistakes
+                }
+                for game in games
+            ]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/players/{player_name}/profile")
+async def get_player_profile(player_name: str, db: AsyncSession = Depends(get_db)):
+    try:
+        profile = await game_service.get_player_profile(db, player_name)
+        if not profile:
+            raise HTTPException(status_code=404, detail="Player not found")
+
+        return {
+            "status": "success",
+            "profile": profile
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
 
 # 添加一个新的路由，处理 /games 请求
 @app.post("/games")
-def save_game_alternative(request: dict, db: Session = Depends(get_db)):
+async def save_game_alternative(request: dict, db: AsyncSession = Depends(get_db)):
     try:
         # 打印请求内容以便调试
         print(f"Received request: {request}")
@@ -224,7 +402,7 @@ def save_game_alternative(request: dict, db: Session = Depends(get_db)):
         else:
             pgn = str(pgn_data)  # 其他情况转换为字符串
         
-        game = game_service.save_game(
+        game = await game_service.save_game(
             db=db,
             fen=fen,
             pgn=pgn,
@@ -238,6 +416,11 @@ def save_game_alternative(request: dict, db: Session = Depends(get_db)):
             "game_id": game.id,
             "name": game.name
         }
+    except HTTPException:
+        raise
+    except ValueError as e:
+        # PGN 中含有非法走法
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error saving game: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Float
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db.base_class import Base
@@ -12,9 +12,26 @@ class Game(Base):
     pgn = Column(Text)
     white_player_id = Column(Integer, ForeignKey("players.id"))
     black_player_id = Column(Integer, ForeignKey("players.id"))
+    # 规范化主线走法与棋手的内容哈希，用于去重
+    content_hash = Column(String(64), unique=True, index=True, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # 分析统计（由 GameService.record_analyses 批量写入）
+    analyzed_at = Column(DateTime(timezone=True), nullable=True)
+    white_accuracy = Column(Float, nullable=True)
+    white_acpl = Column(Float, nullable=True)
+    white_moves = Column(Integer, nullable=True)
+    white_blunders = Column(Integer, nullable=True)
+    white_mistakes = Column(Integer, nullable=True)
+    white_inaccuracies = Column(Integer, nullable=True)
+    black_accuracy = Column(Float, nullable=True)
+    black_acpl = Column(Float, nullable=True)
+    black_moves = Column(Integer, nullable=True)
+    black_blunders = Column(Integer, nullable=True)
+    black_mistakes = Column(Integer, nullable=True)
+    black_inaccuracies = Column(Integer, nullable=True)
+
     white_player = relationship("Player", foreign_keys=[white_player_id])
     black_player = relationship("Player", foreign_keys=[black_player_id])
 
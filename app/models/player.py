@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy import Column, Integer, String, DateTime, Float
 from sqlalchemy.sql import func
 from app.db.base_class import Base
 
@@ -10,5 +10,14 @@ class Player(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # 累计分析统计，随棋局分析增量更新
+    analyzed_games = Column(Integer, nullable=False, default=0, server_default="0")
+    analyzed_moves = Column(Integer, nullable=False, default=0, server_default="0")
+    accuracy_sum = Column(Float, nullable=False, default=0.0, server_default="0")
+    cp_loss_sum = Column(Float, nullable=False, default=0.0, server_default="0")
+    blunders = Column(Integer, nullable=False, default=0, server_default="0")
+    mistakes = Column(Integer, nullable=False, default=0, server_default="0")
+    inaccuracies = Column(Integer, nullable=False, default=0, server_default="0")
+
     def __str__(self) -> str:
         return str(self.name)
\ No newline at end of file
@@ -0,0 +1,82 @@
+import numpy as np
+from typing import Dict, Optional, Sequence
+
+# 分数截断范围（厘兵），将杀按 evaluate_move 中的 mate_score=10000 传入后会被截断
+CP_CLIP = 1000
+# 胜率模型系数（与 Lichess 一致）
+WIN_PROB_COEFFICIENT = 0.00368208
+# 按胜率下降（百分点）划分的失误阈值
+INACCURACY_THRESHOLD = 5.0
+MISTAKE_THRESHOLD = 10.0
+BLUNDER_THRESHOLD = 15.0
+
+SIDES = ("white", "black")
+STAT_FIELDS = ("accuracy", "acpl", "moves", "blunders", "mistakes", "inaccuracies")
+
+
+class AnalyticsService:
+    """基于 NumPy 的批量棋局统计
+
+    输入为多盘棋的逐步评分（白方视角，厘兵），形状为 (棋局数, 最大步数 + 1)，
+    第 i 列为第 i 步走完后的局面评分（第 0 列为初始局面），不足部分用 NaN 填充。
+    """
+
+    def pad_evals(self, evals: Sequence[Sequence[Optional[float]]]) -> np.ndarray:
+        """将不等长的评分序列填充为二维数组"""
+        width = max((len(game_evals) for game_evals in evals), default=0)
+        padded = np.full((len(evals), width), np.nan, dtype=np.float64)
+        for row, game_evals in enumerate(evals):
+            if game_evals:
+                padded[row, :len(game_evals)] = np.array(game_evals, dtype=np.float64)
+        return padded
+
+    def win_probabilities(self, evals: np.ndarray) -> np.ndarray:
+        """将白方视角的厘兵评分转换为白方胜率（0-100）"""
+        cp = np.clip(evals, -CP_CLIP, CP_CLIP)
+        return 50 + 50 * (2 / (1 + np.exp(-WIN_PROB_COEFFICIENT * cp)) - 1)
+
+    def compute_game_stats(self, evals: np.ndarray,
+                           black_first: Optional[Sequence[bool]] = None) -> Dict[str, np.ndarray]:
+        """批量计算每盘棋双方的准确率、平均厘兵损失以及失误次数
+
+        black_first 标记每盘棋是否由黑方先走（从 FEN 局面开始的棋局），默认均为白方先走。
+        返回的字典键为 "white_accuracy"、"black_blunders" 等，每个值为长度等于棋局数的数组。
+        """
+        evals = np.atleast_2d(np.asarray(evals, dtype=np.float64))
+        cp = np.clip(evals, -CP_CLIP, CP_CLIP)
+        win = self.win_probabilities(evals)
+
+        cp_before, cp_after = cp[:, :-1], cp[:, 1:]
+        win_before, win_after = win[:, :-1], win[:, 1:]
+        valid = ~(np.isnan(cp_before) | np.isnan(cp_after))
+
+        # 白方先走时偶数步为白方走子；黑方先走的棋局按行翻转
+        even_plies = np.zeros(cp_before.shape[1], dtype=bool)
+        even_plies[0::2] = True
+        if black_first is None:
+            black_first = np.zeros(cp_before.shape[0], dtype=bool)
+        black_first = np.asarray(black_first, dtype=bool).reshape(-1, 1)
+        white_moves = even_plies[np.newaxis, :] ^ black_first
+
+        sign = np.where(white_moves, 1.0, -1.0)
+        cp_loss = np.where(valid, np.maximum(sign * (cp_before - cp_after), 0), 0)
+        win_drop = np.where(valid, np.maximum(sign * (win_before - win_after), 0), 0)
+        move_accuracy = np.clip(103.1668 * np.exp(-0.04354 * win_drop) - 3.1669, 0, 100)
+
+        blunders = valid & (win_drop >= BLUNDER_THRESHOLD)
+        mistakes = valid & (win_drop >= MISTAKE_THRESHOLD) & ~blunders
+        inaccuracies = valid & (win_drop >= INACCURACY_THRESHOLD) & (win_drop < MISTAKE_THRESHOLD)
+
+        stats = {}
+        for side, side_mask in (("white", white_moves), ("black", ~white_moves)):
+            mask = valid & side_mask
+            moves = mask.sum(axis=1)
+            # 没有有效走法的一方准确率与平均损失记为 NaN
+            with np.errstate(invalid="ignore", divide="ignore"):
+                stats[f"{side}_accuracy"] = np.where(mask, move_accuracy, 0).sum(axis=1) / moves
+                stats[f"{side}_acpl"] = np.where(mask, cp_loss, 0).sum(axis=1) / moves
+            stats[f"{side}_moves"] = moves
+            stats[f"{side}_blunders"] = (blunders & side_mask).sum(axis=1)
+            stats[f"{side}_mistakes"] = (mistakes & side_mask).sum(axis=1)
+            stats[f"{side}_inaccuracies"] = (inaccuracies & side_mask).sum(axis=1)
+        return stats
@@ -0,0 +1,91 @@
+import threading
+from typing import Dict
+
+# Stockfish 单个引擎的最小 Hash（MB）
+MIN_HASH_MB = 16
+
+
+class EngineScheduler:
+    """根据当前并发搜索数为每次搜索分配 Threads 和 Hash
+
+    并发越低，单次搜索获得的线程和 Hash 越多；并发高时每个搜索只分配一个线程。
+    线程从共享预算中分配，进行中的搜索占用的线程在结束前不会再分给其他搜索（每个搜索至少一个线程）。
+    所有引擎进程的 Hash 总和不超过 memory_cap_mb：分配时为尚未分配 Hash 的引擎预留 MIN_HASH_MB，
+    因此 memory_cap_mb 至少为 max_engines * MIN_HASH_MB，配置更小时按该值处理。
+    """
+
+    def __init__(self, total_threads: int, memory_cap_mb: int, max_engines: int):
+        self.total_threads = max(1, total_threads)
+        self.max_engines = max(1, max_engines)
+        self.memory_cap_mb = max(MIN_HASH_MB * self.max_engines, memory_cap_mb)
+        # 空闲引擎保留的 Hash 上限，等于满负载时每个引擎的份额
+        self.idle_hash_mb = self.memory_cap_mb // self.max_engines
+
+        self._lock = threading.Lock()
+        self._active_searches = 0
+        self._threads_in_use = 0
+        self._search_threads: Dict[int, int] = {}
+        self._options: Dict[int, dict] = {}
+        self._allocated_hash_mb = 0
+
+    def begin_search(self, engine) -> dict:
+        """登记一次新搜索，返回需要发送给该引擎的选项（只包含发生变化的项）"""
+        with self._lock:
+            self._active_searches += 1
+            current = self._options.get(id(engine), {})
+            current_hash = current.get("Hash", 0)
+            other_hash = self._allocated_hash_mb - current_hash
+            # 为其他尚未分配 Hash 的引擎预留最小 Hash
+            other_engines = len(self._options) - (1 if current_hash else 0)
+            reserved_hash = (self.max_engines - 1 - other_engines) * MIN_HASH_MB
+
+            threads = max(1, min(
+                self.total_threads // self._active_searches,
+                self.total_threads - self._threads_in_use
+            ))
+            self._threads_in_use += threads
+            self._search_threads[id(engine)] = threads
+
+            hash_mb = min(
+                self.memory_cap_mb // self._active_searches,
+                self.memory_cap_mb - other_hash - reserved_hash
+            )
+            hash_mb = max(MIN_HASH_MB, hash_mb)
+
+            return self._assign(engine, current, {"Threads": threads, "Hash": hash_mb})
+
+    def end_search(self, engine) -> dict:
+        """登记搜索结束并归还线程；仍有其他搜索时，将超出空闲份额的 Hash 缩减后返回
+
+        没有其他搜索时保留 Hash，避免空闲时段连续请求反复调整 Hash。
+        """
+        with self._lock:
+            self._active_searches = max(0, self._active_searches - 1)
+            self._threads_in_use -= self._search_threads.pop(id(engine), 0)
+            current = self._options.get(id(engine), {})
+            if not self._active_searches or current.get("Hash", 0) <= self.idle_hash_mb:
+                return {}
+            return self._assign(engine, current, {"Hash": self.idle_hash_mb})
+
+    def forget(self, engine) -> None:
+        """引擎关闭后释放其 Hash 配额"""
+        with self._lock:
+            options = self._options.pop(id(engine), {})
+            self._allocated_hash_mb -= options.get("Hash", 0)
+
+    def _assign(self, engine, current: dict, options: dict) -> dict:
+        changed = {name: value for name, value in options.items() if current.get(name) != value}
+        if changed:
+            self._allocated_hash_mb += changed.get("Hash", current.get("Hash", 0)) - current.get("Hash", 0)
+            self._options[id(engine)] = {**current, **changed}
+        return changed
+
+    def get_status(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "active_searches": self._active_searches,
+                "threads_in_use": self._threads_in_use,
+                "engines": len(self._options),
+                "allocated_hash_mb": self._allocated_hash_mb,
+                "memory_cap_mb": self.memory_cap_mb,
+            }
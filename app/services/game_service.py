@@ -1,31 +1,55 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+import asyncio
+import chess
+import chess.pgn
+import hashlib
+import io
+import json
+import math
 import re
-from typing import Optional
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional
+from app.core.config import settings
 from app.models.game import Game
 from app.models.player import Player
+from app.services.analytics_service import AnalyticsService, SIDES, STAT_FIELDS
+
+PGN_RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+FEN_HEADER_PATTERN = re.compile(r'\[FEN\s+"([^"]*)"\]')
+# 批量查询内容哈希时每次 IN 查询的数量
+HASH_LOOKUP_CHUNK_SIZE = 500
+# 并发导入发生唯一索引冲突时的最大尝试次数
+IMPORT_MAX_ATTEMPTS = 3
 
 class GameService:
     def __init__(self):
-        pass
+        self.analytics = AnalyticsService()
     
-    def save_game(self, db: Session, fen: str, pgn: str, name: Optional[str] = None, 
+    async def save_game(self, db: AsyncSession, fen: str, pgn: str, name: Optional[str] = None, 
                  white_player: Optional[str] = None, black_player: Optional[str] = None):
-        """保存棋局"""
+        """保存棋局（相同内容的棋局只保存一次，重复保存时返回已有棋局）"""
+        content_hash = self.compute_content_hash(pgn, fen, white_player, black_player)
+        existing = await self._get_game_by_hash(db, content_hash)
+        if existing is not None:
+            return existing
+
         # 处理默认名称
         if not name or name.startswith("ChessGame_"):
-            name = self._generate_default_name(db)
+            name = await self._generate_default_name(db)
         
         # 处理棋手
         white_player_id = None
         black_player_id = None
         
         if white_player:
-            white_player_obj = self._get_or_create_player(db, white_player)
+            white_player_obj = await self._get_or_create_player(db, white_player)
             white_player_id = white_player_obj.id
             
         if black_player:
-            black_player_obj = self._get_or_create_player(db, black_player)
+            black_player_obj = await self._get_or_create_player(db, black_player)
             black_player_id = black_player_obj.id
         
         # 创建新游戏
@@ -34,48 +58,219 @@ class GameService:
             fen=fen,
             pgn=pgn,
             white_player_id=white_player_id,
-            black_player_id=black_player_id
+            black_player_id=black_player_id,
+            content_hash=content_hash
         )
         
         db.add(game)
-        db.commit()
-        db.refresh(game)
+        try:
+            await db.commit()
+        except IntegrityError:
+            # 并发保存同一棋局时，唯一索引冲突，返回先保存的那一条
+            await db.rollback()
+            return await self._get_game_by_hash(db, content_hash)
+        await db.refresh(game)
         
         return game
+
+    def compute_content_hash(self, pgn: str, fen: str, white_player: Optional[str] = None,
+                             black_player: Optional[str] = None) -> str:
+        """根据规范化的主线走法和双方棋手计算棋局内容哈希"""
+        start_fen, moves = self._normalize_mainline(pgn)
+        if not moves:
+            # 没有走法时以保存的局面区分棋局
+            start_fen = fen or start_fen
+        return self._hash_content(start_fen, moves, white_player, black_player)
+
+    def _hash_content(self, start_fen: str, moves: List[str], white_player: Optional[str],
+                      black_player: Optional[str]) -> str:
+        white = self._normalize_player_name(white_player).lower() if white_player else ""
+        black = self._normalize_player_name(black_player).lower() if black_player else ""
+        content = "\n".join([white, black, start_fen, " ".join(moves)])
+        return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+    def _normalize_mainline(self, pgn: str):
+        """解析 PGN（或以空格分隔的 SAN 走法），返回起始局面和 UCI 主线走法
+
+        python-chess 遇到非法走法会截断主线，此时抛出 ValueError，避免用截断后的主线作为去重依据。
+        """
+        parsed = chess.pgn.read_game(io.StringIO(pgn or ""))
+        if parsed is None:
+            return chess.STARTING_FEN, []
+        if parsed.errors:
+            raise ValueError(f"Invalid PGN: {parsed.errors[0]}")
+        return parsed.board().fen(), [move.uci() for move in parsed.mainline_moves()]
+
+    async def _get_game_by_hash(self, db: AsyncSession, content_hash: str):
+        result = await db.execute(select(Game).filter(Game.content_hash == content_hash))
+        return result.scalars().first()
+
+    async def _get_known_hashes(self, db: AsyncSession, hashes: List[str]) -> set:
+        """分批查询已存在的内容哈希"""
+        known = set()
+        for start in range(0, len(hashes), HASH_LOOKUP_CHUNK_SIZE):
+            chunk = hashes[start:start + HASH_LOOKUP_CHUNK_SIZE]
+            known.update((await db.execute(
+                select(Game.content_hash).filter(Game.content_hash.in_(chunk))
+            )).scalars().all())
+        return known
+
+    async def import_games(self, db: AsyncSession, pgn_text: str):
+        """导入包含多盘棋的 PGN 文本，跳过已存在的棋局
+
+        返回值中 imported + skipped 等于提交的棋局数；skipped 包括已存在或文件内重复的棋局（duplicates）、
+        没有走法的棋局（empty）以及走法无法完整解析的棋局（invalid，errors 中给出序号和原因）。
+        """
+        # 解析和计算哈希是 CPU 密集操作，放到线程中执行以免阻塞事件循环
+        candidates, submitted, empty, errors = await asyncio.to_thread(self._parse_import, pgn_text)
+
+        for attempt in range(IMPORT_MAX_ATTEMPTS):
+            try:
+                games = await self._insert_new_games(db, candidates)
+                break
+            except IntegrityError:
+                # 并发导入插入了相同的棋手或棋局，回滚后重新查询已存在的哈希并重试
+                await db.rollback()
+                if attempt == IMPORT_MAX_ATTEMPTS - 1:
+                    raise
+
+        return {
+            "submitted": submitted,
+            "imported": len(games),
+            "skipped": submitted - len(games),
+            "duplicates": submitted - empty - len(errors) - len(games),
+            "empty": empty,
+            "invalid": len(errors),
+            "errors": errors,
+            "game_ids": [game.id for game in games]
+        }
+
+    def _parse_import(self, pgn_text: str):
+        """解析多盘棋 PGN，返回 ({内容哈希: 棋局信息}, 棋局总数, 无走法棋局数, 解析错误列表)"""
+        candidates = {}
+        submitted = 0
+        empty = 0
+        errors = []
+        pgn_io = io.StringIO(pgn_text)
+        while True:
+            parsed = chess.pgn.read_game(pgn_io)
+            if parsed is None:
+                break
+            submitted += 1
+            if parsed.errors:
+                # 含非法走法的棋局主线会被截断，不导入
+                errors.append({"index": submitted - 1, "error": str(parsed.errors[0])})
+                continue
+            white = parsed.headers.get("White", "?")
+            black = parsed.headers.get("Black", "?")
+            white = None if white == "?" else white
+            black = None if black == "?" else black
+
+            board = parsed.board()
+            start_fen = board.fen()
+            moves = []
+            for move in parsed.mainline_moves():
+                moves.append(move.uci())
+                board.push(move)
+            if not moves:
+                empty += 1
+                continue
+
+            content_hash = self._hash_content(start_fen, moves, white, black)
+            if content_hash in candidates:
+                # 同一文件中重复出现的棋局也只导入一次
+                continue
+            event = parsed.headers.get("Event", "?")
+            candidates[content_hash] = {
+                "name": event if event != "?" else f"{white or '?'} vs {black or '?'}",
+                "fen": board.fen(),
+                "pgn": str(parsed),
+                "white": white,
+                "black": black
+            }
+        return candidates, submitted, empty, errors
+
+    async def _insert_new_games(self, db: AsyncSession, candidates: Dict[str, dict]) -> List[Game]:
+        """插入数据库中尚不存在的棋局"""
+        known = await self._get_known_hashes(db, list(candidates))
+        new_games = {content_hash: item for content_hash, item in candidates.items() if content_hash not in known}
+
+        players = await self._get_or_create_players(
+            db, [name for item in new_games.values() for name in (item["white"], item["black"]) if name]
+        )
+        games = []
+        for content_hash, item in new_games.items():
+            white_obj = players.get(self._normalize_player_name(item["white"]).lower()) if item["white"] else None
+            black_obj = players.get(self._normalize_player_name(item["black"]).lower()) if item["black"] else None
+            games.append(Game(
+                name=item["name"],
+                fen=item["fen"],
+                pgn=item["pgn"],
+                white_player_id=white_obj.id if white_obj else None,
+                black_player_id=black_obj.id if black_obj else None,
+                content_hash=content_hash
+            ))
+
+        db.add_all(games)
+        await db.commit()
+        return games
+
+    async def _get_or_create_players(self, db: AsyncSession, names: List[str]) -> Dict[str, Player]:
+        """批量获取或创建棋手，返回以小写规范名称为键的字典"""
+        normalized = {self._normalize_player_name(name).lower(): self._normalize_player_name(name) for name in names}
+        if not normalized:
+            return {}
+
+        players = {
+            player.name.lower(): player
+            for player in (await db.execute(
+                select(Player).filter(func.lower(Player.name).in_(list(normalized)))
+            )).scalars().all()
+        }
+        missing = [Player(name=name) for key, name in normalized.items() if key not in players]
+        if missing:
+            db.add_all(missing)
+            await db.flush()
+            players.update({player.name.lower(): player for player in missing})
+        return players
     
-    def _generate_default_name(self, db: Session) -> str:
+    async def _generate_default_name(self, db: AsyncSession) -> str:
         """生成默认游戏名称"""
         # 查找最后一个默认名称的游戏
         pattern = r'ChessGame_(\d+)'
-        last_game = db.query(Game).filter(
-            Game.name.op('~')(pattern)
-        ).order_by(Game.id.desc()).first()
+        # 使用 LIKE 预筛选（PostgreSQL 和 SQLite 通用），编号在 Python 中解析
+        names = await db.stream_scalars(
+            select(Game.name)
+            .filter(Game.name.like("ChessGame\\_%", escape="\\"))
+            .order_by(Game.id.desc())
+        )
         
         counter = 1
-        if last_game is not None:
-            game_name = str(last_game.name) if last_game.name is not None else ""
-            match = re.match(pattern, game_name)
+        async for game_name in names:
+            match = re.match(pattern, game_name or "")
             if match:
                 counter = int(match.group(1)) + 1
+                break
+        await names.close()
             
         return f"ChessGame_{counter}"
     
-    def _get_or_create_player(self, db: Session, player_name: str):
+    async def _get_or_create_player(self, db: AsyncSession, player_name: str):
         """获取或创建棋手"""
         # 标准化名称 (首字母大写)
         normalized_name = self._normalize_player_name(player_name)
         
         # 查找现有棋手
-        player = db.query(Player).filter(
-            func.lower(Player.name) == func.lower(normalized_name)
-        ).first()
+        player = (await db.execute(
+            select(Player).filter(func.lower(Player.name) == func.lower(normalized_name))
+        )).scalars().first()
         
         # 如果不存在，创建新棋手
         if not player:
             player = Player(name=normalized_name)
             db.add(player)
-            db.commit()
-            db.refresh(player)
+            await db.commit()
+            await db.refresh(player)
             
         return player
     
@@ -86,22 +281,203 @@ class GameService:
         normalized_parts = [part.capitalize() for part in parts]
         return " ".join(normalized_parts)
     
-    def get_player_suggestions(self, db: Session, prefix: str):
+    async def get_player_suggestions(self, db: AsyncSession, prefix: str):
         """根据前缀获取棋手建议"""
         if not prefix or len(prefix) < 2:
             return []
             
         # 不区分大小写搜索
-        players = db.query(Player).filter(
-            func.lower(Player.name).like(f"{prefix.lower()}%")
-        ).all()
+        names = (await db.execute(
+            select(Player.name).filter(func.lower(Player.name).like(f"{prefix.lower()}%"))
+        )).scalars().all()
         
-        return [player.name for player in players]
+        return list(names)
     
-    def get_games(self, db: Session, skip: int = 0, limit: int = 100):
+    async def get_games(self, db: AsyncSession, skip: int = 0, limit: int = 100):
         """获取所有棋局"""
-        return db.query(Game).order_by(Game.created_at.desc()).offset(skip).limit(limit).all()
+        result = await db.execute(
+            select(Game)
+            .options(selectinload(Game.white_player), selectinload(Game.black_player))
+            .order_by(Game.created_at.desc())
+            .offset(skip)
+            .limit(limit)
+        )
+        return result.scalars().all()
     
-    def get_game(self, db: Session, game_id: int):
+    async def get_game(self, db: AsyncSession, game_id: int):
         """获取特定棋局"""
-        return db.query(Game).filter(Game.id == game_id).first()
\ No newline at end of file
+        result = await db.execute(
+            select(Game)
+            .options(selectinload(Game.white_player), selectinload(Game.black_player))
+            .filter(Game.id == game_id)
+        )
+        return result.scalars().first()
+    async def record_analyses(self, db: AsyncSession, analyses: Dict[int, List[Optional[float]]]):
+        """批量写入棋局分析结果，并增量更新棋手统计
+
+        analyses 为 {game_id: 逐步评分}，评分为白方视角的厘兵值（含初始局面）。
+        """
+        # 锁定棋局行，避免并发重新分析时重复扣除旧结果（按 id 排序以避免死锁）
+        games = (await db.execute(
+            select(Game)
+            .filter(Game.id.in_(list(analyses)))
+            .order_by(Game.id)
+            .with_for_update()
+            .execution_options(populate_existing=True)
+        )).scalars().all()
+        if not games:
+            return []
+
+        stats = self.analytics.compute_game_stats(
+            self.analytics.pad_evals([analyses[game.id] for game in games]),
+            black_first=[self._starts_with_black(game) for game in games]
+        )
+
+        player_deltas: Dict[int, Dict[str, float]] = {}
+        for row, game in enumerate(games):
+            for side in SIDES:
+                player_id = getattr(game, f"{side}_player_id")
+                # 重新分析时先扣除旧结果，再累加新结果
+                if player_id and game.analyzed_at is not None:
+                    self._add_player_deltas(player_deltas, player_id, game, side, -1)
+                for field in STAT_FIELDS:
+                    value = stats[f"{side}_{field}"][row].item()
+                    if isinstance(value, float) and math.isnan(value):
+                        value = None
+                    setattr(game, f"{side}_{field}", value)
+                if player_id:
+                    self._add_player_deltas(player_deltas, player_id, game, side, 1)
+            game.analyzed_at = datetime.now(timezone.utc)
+
+        # 在 SQL 中累加增量，并发分析同一棋手的不同棋局时不会互相覆盖
+        for player_id in sorted(player_deltas):
+            await db.execute(
+                update(Player)
+                .where(Player.id == player_id)
+                .values({
+                    getattr(Player, field): getattr(Player, field) + delta
+                    for field, delta in player_deltas[player_id].items()
+                })
+            )
+
+        await db.commit()
+        return games
+
+    def _starts_with_black(self, game: Game) -> bool:
+        """根据 PGN 中的 FEN 头信息判断棋局是否由黑方先走"""
+        match = FEN_HEADER_PATTERN.search(game.pgn or "")
+        if not match:
+            return False
+        fields = match.group(1).split()
+        return len(fields) > 1 and fields[1] == "b"
+
+    def _add_player_deltas(self, player_deltas: Dict[int, Dict[str, float]], player_id: int,
+                           game: Game, side: str, sign: int):
+        """将某盘棋一方的统计计入（或扣出）棋手汇总的增量"""
+        moves = getattr(game, f"{side}_moves") or 0
+        if not moves:
+            return
+        deltas = player_deltas.setdefault(player_id, {
+            "analyzed_games": 0, "analyzed_moves": 0, "accuracy_sum": 0.0, "cp_loss_sum": 0.0,
+            "blunders": 0, "mistakes": 0, "inaccuracies": 0
+        })
+        deltas["analyzed_games"] += sign
+        deltas["analyzed_moves"] += sign * moves
+        deltas["accuracy_sum"] += sign * getattr(game, f"{side}_accuracy")
+        deltas["cp_loss_sum"] += sign * getattr(game, f"{side}_acpl") * moves
+        for field in ("blunders", "mistakes", "inaccuracies"):
+            deltas[field] += sign * getattr(game, f"{side}_{field}")
+
+    async def get_player_profile(self, db: AsyncSession, player_name: str):
+        """根据预先汇总的统计获取棋手档案"""
+        player = (await db.execute(
+            select(Player).filter(
+                func.lower(Player.name) == func.lower(self._normalize_player_name(player_name))
+            )
+        )).scalars().first()
+        if not player:
+            return None
+
+        analyzed_games = player.analyzed_games or 0
+        analyzed_moves = player.analyzed_moves or 0
+        return {
+            "name": player.name,
+            "analyzed_games": analyzed_games,
+            "analyzed_moves": analyzed_moves,
+            "accuracy": player.accuracy_sum / analyzed_games if analyzed_games else None,
+            "acpl": player.cp_loss_sum / analyzed_moves if analyzed_moves else None,
+            "blunders": player.blunders or 0,
+            "mistakes": player.mistakes or 0,
+            "inaccuracies": player.inaccuracies or 0,
+        }
+
+    async def export_games(self, db: AsyncSession, export_format: str = "pgn",
+                           player: Optional[str] = None, date_from: Optional[datetime] = None,
+                           date_to: Optional[datetime] = None) -> AsyncIterator[str]:
+        """流式导出棋局（PGN 或 NDJSON），使用服务端游标分批读取以保持内存占用平稳"""
+        query = (
+            select(Game)
+            .options(joinedload(Game.white_player), joinedload(Game.black_player))
+            .order_by(Game.id)
+            .execution_options(yield_per=settings.EXPORT_BATCH_SIZE)
+        )
+        if player:
+            player_id = select(Player.id).filter(
+                func.lower(Player.name) == func.lower(self._normalize_player_name(player))
+            ).scalar_subquery()
+            query = query.filter(or_(Game.white_player_id == player_id, Game.black_player_id == player_id))
+        if date_from is not None:
+            query = query.filter(Game.created_at >= date_from)
+        if date_to is not None:
+            query = query.filter(Game.created_at <= date_to)
+
+        formatter = self._format_json_line if export_format == "ndjson" else self._format_pgn
+        result = await db.stream(query)
+        async for batch in result.scalars().partitions():
+            # 解析和格式化 PGN 是 CPU 密集操作，按批放到线程中执行以免阻塞事件循环
+            yield await asyncio.to_thread(lambda: "".join(formatter(game) for game in batch))
+
+    def _format_json_line(self, game: Game) -> str:
+        """将棋局转换为一行 JSON"""
+        return json.dumps({
+            "id": game.id,
+            "name": game.name,
+            "fen": game.fen,
+            "pgn": game.pgn,
+            "white_player": game.white_player.name if game.white_player else None,
+            "black_player": game.black_player.name if game.black_player else None,
+            "created_at": game.created_at.isoformat() if game.created_at else None
+        }, ensure_ascii=False) + "\n"
+
+    def _format_pgn(self, game: Game) -> str:
+        """解析保存的 PGN，用棋局和棋手信息覆盖头信息后重新导出
+
+        原有的 FEN、SetUp 等头信息以及注释和变着都会保留。
+        """
+        parsed = chess.pgn.read_game(io.StringIO(game.pgn or "")) or chess.pgn.Game()
+        parsed.headers["Event"] = game.name or "?"
+        parsed.headers["Date"] = game.created_at.strftime("%Y.%m.%d") if game.created_at else "????.??.??"
+        parsed.headers["White"] = game.white_player.name if game.white_player else "?"
+        parsed.headers["Black"] = game.black_player.name if game.black_player else "?"
+
+        if not parsed.errors:
+            return f"{parsed}\n\n"
+
+        # 走法无法完整解析时保留原始走法文本，避免导出被截断的棋局
+        movetext = " ".join(
+            line.strip() for line in (game.pgn or "").splitlines()
+            if line.strip() and not line.strip().startswith("[")
+        )
+        tokens = movetext.split()
+        if tokens and tokens[-1] in PGN_RESULTS:
+            parsed.headers["Result"] = tokens[-1]
+        else:
+            movetext = f"{movetext} {parsed.headers.get('Result', '*')}".strip()
+        header_lines = "\n".join(
+            f'[{tag} "{self._escape_pgn_value(value)}"]' for tag, value in parsed.headers.items()
+        )
+        return f"{header_lines}\n\n{movetext}\n\n"
+
+    def _escape_pgn_value(self, value) -> str:
+        """转义 PGN 头信息中的反斜杠和引号"""
+        return str(value).replace("\\", "\\\\").replace('"', '\\"')
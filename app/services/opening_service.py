@@ -16,6 +16,8 @@ class OpeningService:
         
         # 加载或下载开局数据库
         self.openings = self._load_openings()
+        # 按棋子位置和行动方建立索引，避免逐条比较
+        self.position_index = self._build_position_index(self.openings)
         
     def _download_eco_database(self):
         """下载 ECO 开局数据库"""
@@ -185,6 +187,22 @@ class OpeningService:
                 
         return openings_dict
     
+    def _position_key(self, fen: str) -> str:
+        """只保留 FEN 中的位置和行动方"""
+        return ' '.join(fen.split(' ')[:2])
+
+    def _build_position_index(self, openings):
+        """建立位置到开局信息的索引（同一位置保留最先出现的开局）"""
+        index = {}
+        for stored_fen, opening_info in openings.items():
+            index.setdefault(self._position_key(stored_fen), opening_info)
+        return index
+
+    def common_positions(self, limit: int):
+        """返回走法最少的若干开局局面，用于预热分析缓存"""
+        ordered = sorted(self.openings.items(), key=lambda item: len(item[1].get("pgn", "")))
+        return [fen for fen, _ in ordered[:limit]]
+
     def identify_opening(self, fen: str):
         """识别开局"""
         try:
@@ -195,14 +213,30 @@ class OpeningService:
                 return self.openings[board.fen()]
             
             # 如果没有直接匹配，尝试匹配位置部分
-            position_fen = ' '.join(board.fen().split(' ')[:2])  # 只保留位置和行动方
-            
-            for stored_fen, opening_info in self.openings.items():
-                stored_position = ' '.join(stored_fen.split(' ')[:2])
-                if position_fen == stored_position:
-                    return opening_info
+            opening_info = self.position_index.get(self._position_key(board.fen()))
+            if opening_info is not None:
+                return opening_info
             
             # 如果还是没有匹配，返回未知开局
             return {"name": "未知开局", "code": "", "pgn": ""}
         except Exception as e:
             return {"name": "开局识别错误", "code": "", "error": str(e)}
+
+    def identify_openings(self, fens):
+        """批量识别开局，优先直接查询索引，未命中时才构建棋盘校验 FEN"""
+        results = []
+        for fen in fens:
+            fields = fen.strip().split() if isinstance(fen, str) else []
+            if len(fields) < 2:
+                results.append({"name": "开局识别错误", "code": "", "error": f"Invalid FEN: {fen}"})
+                continue
+            opening_info = self.openings.get(' '.join(fields)) or self.position_index.get(' '.join(fields[:2]))
+            if opening_info is None:
+                # 索引未命中时才构建棋盘，校验 FEN 是否合法
+                try:
+                    chess.Board(fen)
+                except ValueError as e:
+                    results.append({"name": "开局识别错误", "code": "", "error": str(e)})
+                    continue
+            results.append(opening_info or {"name": "未知开局", "code": "", "pgn": ""})
+        return results
@@ -0,0 +1,83 @@
+import threading
+from typing import Any, Callable, Dict, Optional, Set
+from app.services.opening_service import OpeningService
+from app.services.stockfish_service import StockfishService
+
+# 子系统状态
+IDLE = "idle"          # 尚未初始化（首次使用时再创建）
+STARTING = "starting"  # 正在初始化或预热
+READY = "ready"
+FAILED = "failed"
+
+
+class ServiceRegistry:
+    """延迟创建服务实例，并记录各子系统的状态"""
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._states: Dict[str, str] = {}
+        self._errors: Dict[str, Optional[str]] = {}
+        self._optional: Set[str] = set()
+
+    def register(self, name: str, factory: Optional[Callable[[], Any]] = None, required: bool = True) -> None:
+        """登记子系统；没有 factory 的子系统只记录状态。可选子系统失败时不影响就绪"""
+        if factory is not None:
+            self._factories[name] = factory
+            self._locks[name] = threading.Lock()
+        if not required:
+            self._optional.add(name)
+        self.set_state(name, IDLE)
+
+    def get(self, name: str):
+        """获取服务实例，首次调用时创建；创建失败时下次调用会重试"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._locks[name]:
+            instance = self._instances.get(name)
+            if instance is not None:
+                return instance
+            self.set_state(name, STARTING)
+            try:
+                instance = self._factories[name]()
+            except Exception as e:
+                self.set_state(name, FAILED, str(e))
+                raise
+            self._instances[name] = instance
+            self.set_state(name, READY)
+            return instance
+
+    def peek(self, name: str):
+        """获取已创建的服务实例，不触发创建"""
+        return self._instances.get(name)
+
+    def set_state(self, name: str, state: str, error: Optional[str] = None) -> None:
+        self._states[name] = state
+        self._errors[name] = error
+
+    def get_status(self) -> Dict[str, dict]:
+        status = {}
+        for name, state in self._states.items():
+            status[name] = {"state": state, "required": name not in self._optional}
+            if self._errors.get(name):
+                status[name]["error"] = self._errors[name]
+        return status
+
+    def is_ready(self) -> bool:
+        """没有子系统在初始化或预热中，且必需子系统均未失败时可以接收流量"""
+        return all(
+            state != STARTING and (state != FAILED or name in self._optional)
+            for name, state in self._states.items()
+        )
+
+
+registry = ServiceRegistry()
+registry.register("database")
+registry.register("openings", OpeningService)
+# 没有 Stockfish 时仍可提供数据库和开局识别服务
+registry.register("stockfish", StockfishService, required=False)
+registry.register("eval_cache", required=False)
+
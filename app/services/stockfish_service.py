@@ -1,35 +1,151 @@
 import chess
 import chess.engine
 import os
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Iterator, List
 from app.core.config import settings
+from app.services.engine_scheduler import EngineScheduler
 
 class StockfishService:
     def __init__(self):
         self.engine_path = settings.STOCKFISH_PATH
         if not os.path.exists(self.engine_path):
             raise Exception(f"Stockfish not found at {self.engine_path}")
+
+        # 可复用的引擎进程池，最多同时运行 STOCKFISH_MAX_ENGINES 个引擎
+        self.max_engines = max(1, settings.STOCKFISH_MAX_ENGINES)
+        self._idle_engines = queue.LifoQueue()
+        self._engine_slots = threading.BoundedSemaphore(self.max_engines)
+        # 关闭后归还的引擎直接退出，不再放回进程池
+        self._pool_lock = threading.Lock()
+        self._closed = False
+
+        # 局面分析结果缓存（LRU），键为 (FEN, 深度)
+        self.eval_cache_size = settings.EVAL_CACHE_SIZE
+        self._eval_cache = OrderedDict()
+        self._eval_cache_lock = threading.Lock()
+
+        # 按当前并发为每次搜索分配 Threads 和 Hash
+        self.scheduler = EngineScheduler(
+            total_threads=settings.STOCKFISH_THREADS,
+            memory_cap_mb=settings.STOCKFISH_HASH_TOTAL_MB,
+            max_engines=self.max_engines
+        )
+
+    @contextmanager
+    def _pooled_engine(self):
+        """从进程池借用一个引擎并按当前负载配置，用完归还；出错的引擎直接关闭"""
+        self._engine_slots.acquire()
+        try:
+            try:
+                engine = self._idle_engines.get_nowait()
+            except queue.Empty:
+                engine = chess.engine.SimpleEngine.popen_uci(self.engine_path)
+        except Exception:
+            self._engine_slots.release()
+            raise
+
+        try:
+            try:
+                options = self.scheduler.begin_search(engine)
+                if options:
+                    engine.configure(options)
+                yield engine
+            finally:
+                options = self.scheduler.end_search(engine)
+                if options:
+                    engine.configure(options)
+        except chess.engine.EngineError:
+            self._close_engine(engine)
+            engine = None
+            raise
+        finally:
+            if engine is not None:
+                self._return_engine(engine)
+            self._engine_slots.release()
+
+    def _return_engine(self, engine):
+        """将引擎放回进程池；进程池已关闭时直接关闭引擎"""
+        with self._pool_lock:
+            if not self._closed:
+                self._idle_engines.put(engine)
+                return
+        self._close_engine(engine)
+
+    def _close_engine(self, engine):
+        self.scheduler.forget(engine)
+        try:
+            engine.quit()
+        except Exception:
+            pass
+
+    def prespawn(self, count: int) -> int:
+        """预先启动引擎进程放入进程池，返回实际启动的数量"""
+        spawned = 0
+        for _ in range(min(count, self.max_engines) - self._idle_engines.qsize()):
+            if not self._engine_slots.acquire(blocking=False):
+                break
+            try:
+                self._return_engine(chess.engine.SimpleEngine.popen_uci(self.engine_path))
+                spawned += 1
+            finally:
+                self._engine_slots.release()
+        return spawned
+
+    def _get_cached_eval(self, key):
+        with self._eval_cache_lock:
+            result = self._eval_cache.get(key)
+            if result is not None:
+                self._eval_cache.move_to_end(key)
+            return result
+
+    def _cache_eval(self, key, result):
+        with self._eval_cache_lock:
+            self._eval_cache[key] = result
+            self._eval_cache.move_to_end(key)
+            while len(self._eval_cache) > self.eval_cache_size:
+                self._eval_cache.popitem(last=False)
+
+    def shutdown(self):
+        """关闭进程池：关闭所有空闲引擎，仍在使用的引擎归还时再关闭"""
+        with self._pool_lock:
+            self._closed = True
+        while True:
+            try:
+                engine = self._idle_engines.get_nowait()
+            except queue.Empty:
+                return
+            self._close_engine(engine)
     
     def analyze_position(self, fen: str, depth: int = 20):
         try:
-            transport = chess.engine.SimpleEngine.popen_uci(self.engine_path)
             board = chess.Board(fen)
+            cache_key = (board.fen(), depth)
+            cached = self._get_cached_eval(cache_key)
+            if cached is not None:
+                return dict(cached)
             
             try:
-                # 获取详细分析
-                result = transport.analyse(board, chess.engine.Limit(depth=depth))
-                
-                # 获取最佳走法（不需要深度分析）
-                best_move = transport.play(board, chess.engine.Limit(time=0.1))
-                
-                return {
-                    "score": str(result["score"].relative) if "score" in result else None,
-                    "best_move": best_move.move.uci() if best_move.move else None,
-                    "pv": [move.uci() for move in result.get("pv", [])][:5] if "pv" in result else []
-                }
+                with self._pooled_engine() as transport:
+                    # 获取详细分析
+                    result = transport.analyse(board, chess.engine.Limit(depth=depth))
+                    
+                    # 获取最佳走法（不需要深度分析）
+                    best_move = transport.play(board, chess.engine.Limit(time=0.1))
             except Exception as e:
                 raise Exception(f"Analysis error: {str(e)}")
-            finally:
-                transport.quit()
+            
+            analysis = {
+                "score": str(result["score"].relative) if "score" in result else None,
+                "best_move": best_move.move.uci() if best_move.move else None,
+                "pv": [move.uci() for move in result.get("pv", [])][:5] if "pv" in result else []
+            }
+            self._cache_eval(cache_key, analysis)
+            return dict(analysis)
         except Exception as e:
             raise Exception(f"Stockfish error: {str(e)}")
     
@@ -38,23 +154,50 @@ class StockfishService:
         快速获取最佳走法，不进行深度分析
         """
         try:
-            transport = chess.engine.SimpleEngine.popen_uci(self.engine_path)
             board = chess.Board(fen)
             
-            try:
+            with self._pooled_engine() as transport:
                 result = transport.play(board, chess.engine.Limit(time=time_limit))
+            return {
+                "best_move": result.move.uci() if result.move else None
+            }
+        except Exception as e:
+            raise Exception(f"Stockfish error: {str(e)}")
+    
+    def get_best_moves(self, fens: List[str], time_limit: float = 0.1) -> Iterator[dict]:
+        """
+        批量获取最佳走法：分发到多个引擎并行计算，按输入顺序逐个返回结果
+        """
+        def search(item):
+            index, fen = item
+            try:
+                board = chess.Board(fen)
+            except ValueError as e:
+                return {"index": index, "fen": fen, "error": f"Invalid FEN: {str(e)}"}
+            if board.is_game_over():
+                return {"index": index, "fen": fen, "best_move": None}
+            try:
+                with self._pooled_engine() as engine:
+                    result = engine.play(board, chess.engine.Limit(time=time_limit))
                 return {
+                    "index": index,
+                    "fen": fen,
                     "best_move": result.move.uci() if result.move else None
                 }
-            finally:
-                transport.quit()
-        except Exception as e:
-            raise Exception(f"Stockfish error: {str(e)}")
+            except Exception as e:
+                return {"index": index, "fen": fen, "error": f"Stockfish error: {str(e)}"}
+
+        executor = ThreadPoolExecutor(max_workers=min(self.max_engines, max(1, len(fens))))
+        try:
+            # map 按提交顺序产出结果，先完成的结果会等待前面的结果
+            for result in executor.map(search, enumerate(fens)):
+                yield result
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
     
     def evaluate_move(self, fen: str, move: str, depth: int = 20):
         """评估具体走法的质量"""
         try:
-            transport = chess.engine.SimpleEngine.popen_uci(self.engine_path)
             board = chess.Board(fen)
             
             # 验证走法是否合法
@@ -67,7 +210,7 @@ class StockfishService:
                     "evaluation": None
                 }
 
-            try:
+            with self._pooled_engine() as transport:
                 # 获取走子前的评分
                 before_analysis = transport.analyse(board, chess.engine.Limit(depth=depth))
                 if 'score' not in before_analysis:
@@ -118,9 +261,6 @@ class StockfishService:
                 }
                 
                 return evaluation
-            
-            finally:
-                transport.quit()
                 
         except Exception as e:
             return {
@@ -0,0 +1,52 @@
+import asyncio
+import logging
+from app.core.config import settings
+from app.services.registry import ServiceRegistry, FAILED, READY, STARTING
+
+logger = logging.getLogger(__name__)
+
+WARMUP_SUBSYSTEMS = ("openings", "stockfish", "eval_cache")
+
+
+def mark_warming(registry: ServiceRegistry) -> None:
+    """在后台预热开始前标记子系统，使就绪检查在预热完成前返回未就绪"""
+    for name in WARMUP_SUBSYSTEMS:
+        registry.set_state(name, STARTING)
+
+
+async def warm_up(registry: ServiceRegistry) -> None:
+    """后台预热：加载开局索引、预启动引擎并用常见局面填充分析缓存"""
+    opening_service = None
+    stockfish_service = None
+
+    try:
+        opening_service = await asyncio.to_thread(registry.get, "openings")
+    except Exception as e:
+        logger.warning(f"开局数据库预热失败: {str(e)}")
+
+    try:
+        stockfish_service = await asyncio.to_thread(registry.get, "stockfish")
+        registry.set_state("stockfish", STARTING)
+        spawned = await asyncio.to_thread(stockfish_service.prespawn, settings.WARMUP_ENGINES)
+        registry.set_state("stockfish", READY)
+        logger.info(f"预先启动了 {spawned} 个 Stockfish 引擎")
+    except Exception as e:
+        registry.set_state("stockfish", FAILED, str(e))
+        logger.warning(f"Stockfish 预热失败: {str(e)}")
+
+    if opening_service is None or stockfish_service is None:
+        registry.set_state("eval_cache", FAILED, "openings or stockfish unavailable")
+        return
+
+    positions = opening_service.common_positions(settings.WARMUP_EVAL_POSITIONS)
+    results = await asyncio.gather(
+        *(
+            asyncio.to_thread(stockfish_service.analyze_position, fen, settings.WARMUP_EVAL_DEPTH)
+            for fen in positions
+        ),
+        return_exceptions=True
+    )
+    failures = [result for result in results if isinstance(result, Exception)]
+    # 缓存预热只是优化，部分局面失败不影响就绪
+    registry.set_state("eval_cache", READY)
+    logger.info(f"分析缓存预热完成: {len(positions) - len(failures)}/{len(positions)} 个局面")
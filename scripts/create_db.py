@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import sys
 import os
@@ -6,18 +7,13 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.db.init_db import init_db
-from app.db.session import SessionLocal
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 def main() -> None:
     logger.info("创建初始数据")
-    db = SessionLocal()
-    try:
-        init_db(db)
-    finally:
-        db.close()
+    asyncio.run(init_db())
     logger.info("初始数据创建完成")
 
 if __name__ == "__main__":